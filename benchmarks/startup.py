@@ -0,0 +1,76 @@
+"""
+Cold start benchmark: time to import the app and time to serve the first
+request, measured in fresh interpreters so nothing is cached between runs.
+
+    pipenv run bench-startup
+    pipenv run bench-startup --runs 10 --max-import-ms 800
+
+With --max-import-ms / --max-first-request-ms the script exits with status 1
+when the median goes over the limit, so it can run in CI to catch cold start
+regressions.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get(%r)
+served = time.perf_counter()
+assert response.status_code < 500, response.status_code
+print(json.dumps({"import_ms": (imported - start) * 1000, "first_request_ms": (served - imported) * 1000}))
+"""
+
+CONFIGS = {
+    "api only": {"ADMIN_ENABLED": "false", "SWAGGER_ENABLED": "false"},
+    "admin + swagger": {"ADMIN_ENABLED": "true", "SWAGGER_ENABLED": "true"},
+}
+
+
+def measure(env, path):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE % path],
+        cwd=SRC, env=dict(os.environ, **env), capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/character", help="endpoint used for the first request")
+    parser.add_argument("--max-import-ms", type=float, help="fail when the API only import median is slower")
+    parser.add_argument("--max-first-request-ms", type=float, help="fail when the API only first request median is slower")
+    args = parser.parse_args()
+
+    medians = {}
+    print("%-18s %12s %18s" % ("config", "import ms", "first request ms"))
+    for name, env in CONFIGS.items():
+        samples = [measure(env, args.path) for _ in range(args.runs)]
+        medians[name] = {
+            key: statistics.median(sample[key] for sample in samples)
+            for key in ("import_ms", "first_request_ms")
+        }
+        print("%-18s %12.1f %18.1f" % (name, medians[name]["import_ms"], medians[name]["first_request_ms"]))
+
+    api_only = medians["api only"]
+    failed = False
+    if args.max_import_ms is not None and api_only["import_ms"] > args.max_import_ms:
+        print("import time %.1f ms is over the %.1f ms budget" % (api_only["import_ms"], args.max_import_ms))
+        failed = True
+    if args.max_first_request_ms is not None and api_only["first_request_ms"] > args.max_first_request_ms:
+        print("first request %.1f ms is over the %.1f ms budget" % (api_only["first_request_ms"], args.max_first_request_ms))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
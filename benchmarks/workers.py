@@ -0,0 +1,109 @@
+"""
+Compares gunicorn worker classes on this app. For every mode it starts
+gunicorn with gunicorn.conf.py, waits for the workers and hammers a few read
+endpoints from a pool of client threads, then prints throughput and latency.
+It does not seed data, point DATABASE_URL at a database that has some.
+
+    pipenv run bench-workers
+    pipenv run bench-workers --modes sync gthread --clients 64 --seconds 20
+
+Results and the setup they were measured on are kept in docs/BENCHMARKS.md.
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PATHS = ["/character", "/planet", "/character/1", "/user/1/favorites"]
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not come up at " + url)
+
+
+def load(base_url, clients, seconds):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + seconds
+
+    def client(offset):
+        own = []
+        failed = 0
+        i = offset
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(base_url + PATHS[i % len(PATHS)], timeout=10).read()
+                own.append(time.perf_counter() - start)
+            except OSError:
+                failed += 1
+            i += 1
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+        "errors": errors[0]
+    }
+
+
+def run_mode(mode, args):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=mode, WEB_CONCURRENCY=str(args.workers))
+    server = subprocess.Popen(
+        ["gunicorn", "wsgi", "--chdir", "./src/", "--config", "gunicorn.conf.py",
+         "--bind", "127.0.0.1:%d" % args.port, "--access-logfile", "/dev/null"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = "http://127.0.0.1:%d" % args.port
+    try:
+        wait_ready(base_url + "/character")
+        load(base_url, args.clients, 2)
+        return load(base_url, args.clients, args.seconds)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["sync", "gthread", "gevent"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print("%-8s %10s %10s %10s %8s" % ("mode", "req/s", "p50 ms", "p99 ms", "errors"))
+    for mode in args.modes:
+        result = run_mode(mode, args)
+        print("%-8s %10.0f %10.1f %10.1f %8d" % (mode, result["rps"], result["p50_ms"], result["p99_ms"], result["errors"]))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
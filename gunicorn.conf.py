@@ -0,0 +1,103 @@
+"""
+Gunicorn settings for production, used by the Procfile and render.yaml:
+
+    gunicorn wsgi --chdir ./src/ --config gunicorn.conf.py
+
+Everything can be tuned from the environment:
+
+    WEB_CONCURRENCY         number of workers (default: 2 * usable cores + 1, at most 4)
+    GUNICORN_WORKER_CLASS   sync, gthread or gevent (default: gthread)
+    GUNICORN_THREADS        threads per gthread worker (default: 4)
+    GUNICORN_CONNECTIONS    concurrent connections per gevent worker (default: 100)
+    GUNICORN_PRELOAD        import the app once in the master before forking (default: true)
+    GUNICORN_WARMUP         warm each worker up before it accepts requests (default: true)
+    GUNICORN_TIMEOUT        worker timeout in seconds (default: 30)
+
+gevent is not in the Pipfile, install it with `pipenv install gevent` on the
+nodes that use it. See docs/BENCHMARKS.md for how the worker classes compare.
+"""
+import math
+import multiprocessing
+import os
+
+# every worker holds its own connection pool, keep the default small enough
+# for a free plan database and memory limit
+MAX_DEFAULT_WORKERS = 4
+
+
+def env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def read_cgroup_quota():
+    # cgroup v2, then v1. None when the container has no CPU limit.
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def usable_cpus():
+    # cpu_count() is the host's inside a container, the affinity mask and the
+    # cgroup quota are what this process actually gets
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+    quota = read_cgroup_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    # patch before anything else is imported, preload_app imports the app
+    # in the master and it has to see the patched socket and threading
+    from gevent import monkey
+    monkey.patch_all()
+
+workers = int(os.getenv("WEB_CONCURRENCY", min(usable_cpus() * 2 + 1, MAX_DEFAULT_WORKERS)))
+threads = int(os.getenv("GUNICORN_THREADS", 4)) if worker_class == "gthread" else 1
+worker_connections = int(os.getenv("GUNICORN_CONNECTIONS", 100))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+keepalive = 5
+
+preload_app = env_flag("GUNICORN_PRELOAD", "true")
+warmup = env_flag("GUNICORN_WARMUP", "true")
+
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    # the master may have opened connections while importing the app, a
+    # socket shared between processes corrupts the protocol. close=False
+    # leaves the parent's connections alone and gives the child a fresh pool.
+    from models import db
+    from app import app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    if not warmup:
+        return
+    from app import app
+    from warmup import warm_up
+    # a worker never uses more connections at once than it has threads
+    elapsed = warm_up(app, connections=worker.cfg.threads)
+    worker.log.info("Worker warmed up in %.0f ms", elapsed * 1000)
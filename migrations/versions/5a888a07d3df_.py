@@ -0,0 +1,31 @@
+"""empty message
+
+Revision ID: 5a888a07d3df
+Revises: 08b2be63dd7d
+Create Date: 2026-10-19 15:11:56.861851
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a888a07d3df'
+down_revision = '08b2be63dd7d'
+branch_labels = None
+depends_on = None
+
+
+CATALOG_TABLES = ('character', 'planet', 'film', 'vehicle', 'specie')
+
+
+def upgrade():
+    # expression indexes can't be autogenerated, lower(name) for the
+    # case insensitive /<entity>/by-name lookups
+    for table in CATALOG_TABLES:
+        op.create_index('ix_{}_name_lower'.format(table), table, [sa.text('lower(name)')], unique=False)
+
+
+def downgrade():
+    for table in CATALOG_TABLES:
+        op.drop_index('ix_{}_name_lower'.format(table), table_name=table)
@@ -0,0 +1,56 @@
+"""empty message
+
+Revision ID: 72a8cc089b5a
+Revises: 5a888a07d3df
+Create Date: 2026-10-19 15:13:53.379834
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '72a8cc089b5a'
+down_revision = '5a888a07d3df'
+branch_labels = None
+depends_on = None
+
+
+FAVORITE_TABLES = (
+    ('favorite_character', 'character'),
+    ('favorite_planet', 'planet'),
+    ('favorite_film', 'film'),
+    ('favorite_vehicle', 'vehicle'),
+    ('favorite_specie', 'specie'),
+)
+
+# Postgres names the existing foreign keys <table>_<column>_fkey. On SQLite
+# they have no name, the naming convention gives the reflected ones that same
+# name so batch mode can drop them.
+NAMING_CONVENTION = {"fk": "%(table_name)s_%(column_0_name)s_fkey"}
+
+
+def replace_foreign_keys(ondelete):
+    for table, entity in FAVORITE_TABLES:
+        with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+            for column, referred in (('user_id', 'user'), (entity + '_id', entity)):
+                name = '{}_{}_fkey'.format(table, column)
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    # ON DELETE CASCADE needs an index on the child column to find the rows
+    for table, entity in FAVORITE_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index('ix_{}_{}_id_user_id'.format(table, entity), [entity + '_id', 'user_id'], unique=False)
+
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
+
+    for table, entity in FAVORITE_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index('ix_{}_{}_id_user_id'.format(table, entity))
@@ -0,0 +1,41 @@
+"""empty message
+
+Revision ID: bd9b035656b7
+Revises: f091bf17621b
+Create Date: 2026-10-19 18:02:11.604213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bd9b035656b7'
+down_revision = 'f091bf17621b'
+branch_labels = None
+depends_on = None
+
+
+# the plain lower() indexes postgres has a text_pattern_ops twin for
+LOWER_INDEXES = (
+    ('ix_user_email_lower', 'user', 'email'),
+    ('ix_character_name_lower', 'character', 'name'),
+    ('ix_planet_name_lower', 'planet', 'name'),
+    ('ix_film_name_lower', 'film', 'name'),
+    ('ix_vehicle_name_lower', 'vehicle', 'name'),
+    ('ix_specie_name_lower', 'specie', 'name'),
+)
+
+
+def upgrade():
+    # the text_pattern_ops indexes serve equality on lower() as well, the
+    # plain ones only cost writes there. sqlite keeps them.
+    if op.get_bind().dialect.name == 'postgresql':
+        for index, table, _ in LOWER_INDEXES:
+            op.drop_index(index, table_name=table)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for index, table, column in LOWER_INDEXES:
+            op.create_index(index, table, [sa.text('lower({})'.format(column))], unique=False)
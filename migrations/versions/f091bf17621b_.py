@@ -0,0 +1,47 @@
+"""empty message
+
+Revision ID: f091bf17621b
+Revises: 6eb800de1e21
+Create Date: 2026-10-19 15:25:32.377811
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f091bf17621b'
+down_revision = '6eb800de1e21'
+branch_labels = None
+depends_on = None
+
+
+# table, column of the admin AJAX lookups
+LOOKUP_COLUMNS = (
+    ('user', 'email'),
+    ('character', 'name'),
+    ('planet', 'name'),
+    ('film', 'name'),
+    ('vehicle', 'name'),
+    ('specie', 'name'),
+)
+
+
+def upgrade():
+    # expression indexes can't be autogenerated. The catalog tables already
+    # have lower(name) from the by-name lookups.
+    op.create_index('ix_user_email_lower', 'user', [sa.text('lower(email)')], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # LIKE 'term%' only uses an index with text_pattern_ops unless the
+        # database collation is C
+        for table, column in LOOKUP_COLUMNS:
+            op.execute('CREATE INDEX ix_{0}_{1}_lower_pattern ON "{0}" (lower({1}) text_pattern_ops)'.format(table, column))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, column in LOOKUP_COLUMNS:
+            op.drop_index('ix_{}_{}_lower_pattern'.format(table, column), table_name=table)
+
+    op.drop_index('ix_user_email_lower', table_name='user')
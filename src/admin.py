@@ -1,20 +1,47 @@
 import os
-from flask_admin import Admin
-from models import db, User, Character, Planet, Favorite_character, Favorite_planet
-from flask_admin.contrib.sqla import ModelView
+import threading
+from flask import Flask
+from models import db, User, CATALOG_MODELS, FAVORITE_MODELS
+
+def setup_admin(app, url=None):
+    # flask_admin is only imported when the admin is actually built
+    from flask_admin import Admin
+    from admin_views import UserView, CatalogView, FavoriteView
 
-def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
-    admin = Admin(app, name='Cris Admin', template_mode='bootstrap3')
+    admin = Admin(app, name='Cris Admin', template_mode='bootstrap3', url=url)
 
-    
-    # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Character, db.session))
-    admin.add_view(ModelView(Planet, db.session))
 
-    admin.add_view(ModelView(Favorite_character, db.session))
-    admin.add_view(ModelView(Favorite_planet, db.session))
+    # Add your models here, for example this is how we add a the User model to the admin
+    admin.add_view(UserView(User, db.session))
+    for model in CATALOG_MODELS.values():
+        admin.add_view(CatalogView(model, db.session, category='Catalog'))
+    for model in FAVORITE_MODELS.values():
+        admin.add_view(FavoriteView(model, db.session, category='Favorites'))
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
+
+
+class LazyAdmin:
+    """WSGI app mounted on /admin that builds the admin on its first request."""
+
+    def __init__(self, app):
+        self.app = app
+        self.admin_app = None
+        self.lock = threading.Lock()
+
+    def build(self):
+        admin_app = Flask(__name__, static_folder=None)
+        admin_app.config.update(self.app.config)
+        db.init_app(admin_app)
+        # mounted under /admin already, so the admin lives at the root
+        setup_admin(admin_app, url='/')
+        return admin_app
+
+    def __call__(self, environ, start_response):
+        if self.admin_app is None:
+            with self.lock:
+                if self.admin_app is None:
+                    self.admin_app = self.build()
+        return self.admin_app(environ, start_response)
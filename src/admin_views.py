@@ -0,0 +1,154 @@
+"""
+Admin views that stay cheap on big tables:
+
+- list pages start after a primary key found on the primary key index
+  alone instead of OFFSET over full rows,
+- the row count comes from the planner estimate on Postgres or from a
+  short lived cache, not from an exact COUNT(*) on every page,
+- foreign keys in forms are picked through AJAX with a prefix search on an
+  indexed column instead of a dropdown with every row of the table.
+
+Only imported when the admin is built, flask_admin stays out of API workers.
+"""
+import string
+import time
+from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.ajax import QueryAjaxModelLoader
+from flask_admin.model.ajax import DEFAULT_PAGE_SIZE
+from sqlalchemy import and_, func, or_, select, text
+from models import User
+
+COUNT_CACHE_SECONDS = 60
+# sqlite's lower() only folds A-Z, the term has to be folded the same way
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+MAX_CHAR = chr(0x10FFFF)
+
+
+class PrefixAjaxModelLoader(QueryAjaxModelLoader):
+    """AJAX lookup that matches the beginning of indexed columns.
+
+    Like the stock loader it ignores case, but it only matches prefixes so an
+    index on lower(field) serves it instead of scanning the whole table for
+    '%term%'. Postgres gets LIKE 'term%' for its text_pattern_ops indexes,
+    sqlite a range from the term up to the term with its last character
+    bumped, which holds exactly the strings starting with the term in
+    sqlite's binary collation. sqlite's lower() leaves non-ASCII letters
+    alone, so there only A-Z are matched without case.
+    """
+
+    def format(self, model):
+        if not model:
+            return None
+        return getattr(model, self.pk), getattr(model, self.fields[0])
+
+    def get_list(self, term, offset=0, limit=DEFAULT_PAGE_SIZE):
+        query = self.get_query()
+        if term:
+            if self.session.get_bind().dialect.name == "postgresql":
+                term = term.lower()
+                pattern = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                matches = [func.lower(field).like(pattern, escape="\\") for field in self._cached_fields]
+            else:
+                term = term.translate(ASCII_LOWER)
+                upper = prefix_upper_bound(term)
+                matches = [
+                    and_(func.lower(field) >= term, func.lower(field) < upper) if upper is not None
+                    else func.lower(field) >= term
+                    for field in self._cached_fields
+                ]
+            query = query.filter(or_(*matches))
+        return query.order_by(func.lower(self._cached_fields[0])).offset(offset).limit(limit).all()
+
+
+def prefix_upper_bound(term):
+    """Smallest string above every string that starts with term, None if
+    there is none (the term is only U+10FFFF characters)."""
+    term = term.rstrip(MAX_CHAR)
+    if not term:
+        return None
+    bumped = ord(term[-1]) + 1
+    if 0xD800 <= bumped <= 0xDFFF:
+        # surrogates can't be encoded, nothing is stored between them
+        bumped = 0xE000
+    return term[:-1] + chr(bumped)
+
+
+class ScalableModelView(ModelView):
+    page_size = 50
+    can_set_page_size = False
+    column_display_pk = True
+    column_display_fk = True
+
+    def __init__(self, model, session, **kwargs):
+        super().__init__(model, session, **kwargs)
+        self._count = None
+        self._count_expires = 0
+
+    def estimated_count(self):
+        if self.session.get_bind().dialect.name == "postgresql":
+            estimate = self.session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+                {"table": self.model.__tablename__}
+            ).scalar()
+            # -1 means the table was never analyzed, count it instead
+            if estimate is not None and estimate >= 0:
+                return estimate
+
+        if self._count is None or time.time() > self._count_expires:
+            self._count = self.session.execute(
+                select(func.count()).select_from(self.model)
+            ).scalar()
+            self._count_expires = time.time() + COUNT_CACHE_SECONDS
+        return self._count
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        if search or filters or (sort_column is not None and sort_column != "id"):
+            # narrowed or sorted by another column, use the regular path
+            return super().get_list(page, sort_column, sort_desc, search, filters, execute, page_size)
+
+        page = page or 0
+        page_size = page_size or self.page_size
+        pk = self.model.id
+        query = self.get_query()
+
+        if page:
+            # the view is shared by every admin and rows come and go between
+            # pages, so the start is looked up on the primary key index alone
+            # every time instead of remembered
+            after = select(pk).order_by(pk.desc() if sort_desc else pk).offset(page * page_size - 1).limit(1).scalar_subquery()
+            query = query.filter(pk < after if sort_desc else pk > after)
+
+        query = query.order_by(pk.desc() if sort_desc else pk).limit(page_size)
+        if not execute:
+            return self.estimated_count(), query
+
+        return self.estimated_count(), query.all()
+
+
+class UserView(ScalableModelView):
+    column_list = ("id", "email", "user_name")
+    column_sortable_list = ("id", "email")
+    form_columns = ("email", "user_name", "password")
+
+
+class CatalogView(ScalableModelView):
+    column_list = ("id", "name", "description", "imageLink", "updated_at")
+    column_sortable_list = ("id", "name")
+    form_columns = ("name", "description", "imageLink")
+
+
+class FavoriteView(ScalableModelView):
+    column_sortable_list = ("id",)
+
+    def __init__(self, model, session, **kwargs):
+        relationships = model.__mapper__.relationships
+        self.column_list = ["id"] + [column.key for column in model.__table__.columns if column.foreign_keys]
+        self.form_columns = [relationship.key for relationship in relationships]
+        self.form_ajax_refs = {
+            relationship.key: PrefixAjaxModelLoader(
+                relationship.key, session, relationship.mapper.class_,
+                fields=["email" if relationship.mapper.class_ is User else "name"]
+            )
+            for relationship in relationships
+        }
+        super().__init__(model, session, **kwargs)
@@ -2,13 +2,20 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
+import json
+from urllib.parse import urlsplit
+from flask import Flask, Response, request, jsonify, url_for
 from flask_migrate import Migrate
-from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
-from models import db, User, Character, Planet, Favorite_character, Favorite_planet
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from utils import APIException, generate_sitemap, parse_ids, get_by_ids
+from admin import LazyAdmin
+from sqlalchemy import func
+from events import bus
+from idempotency import replay_stored_response, store_response
+from snapshot import catalog_table, snapshot_stats
+from favorites_document import FAVORITES_DOCUMENT_ENABLED, favorites_cli, get_document, build_document
+from models import db, User, Character, Planet, Favorite_character, Favorite_planet, Change, CATALOG_MODELS, FAVORITE_MODELS
 
 # from models import Person
 
@@ -23,10 +30,25 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# admin and swagger are opt-in, API only nodes skip them
+app.config['ADMIN_ENABLED'] = os.getenv("ADMIN_ENABLED", "false").lower() in ("1", "true", "yes")
+app.config['SWAGGER_ENABLED'] = os.getenv("SWAGGER_ENABLED", "false").lower() in ("1", "true", "yes")
+
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 500
+STREAM_KEEPALIVE_SECONDS = 15
+BATCH_MAX_REQUESTS = 20
+BY_NAME_MAX_NAMES = 100
+FAVORITED_BY_PAGE_SIZE = 100
+FAVORITED_BY_MAX_PAGE_SIZE = 1000
+
 MIGRATE = Migrate(app, db)
 db.init_app(app)
 CORS(app)
-setup_admin(app)
+app.cli.add_command(favorites_cli)
+
+if app.config['ADMIN_ENABLED']:
+    app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {'/admin': LazyAdmin(app)})
 
 # Handle/serialize errors like a JSON object
 
@@ -35,6 +57,11 @@ setup_admin(app)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
+# Idempotency-Key: a retried POST gets the stored response back
+
+app.before_request(replay_stored_response)
+app.after_request(store_response)
+
 # generate sitemap with all your endpoints
 
 
@@ -42,6 +69,12 @@ def handle_invalid_usage(error):
 def sitemap():
     return generate_sitemap(app)
 
+if app.config['SWAGGER_ENABLED']:
+    @app.route('/spec')
+    def spec():
+        from flask_swagger import swagger
+        return jsonify(swagger(app))
+
 #Conseguir la lista de los elementos que estamos queriendo ver
 @app.route('/user', methods=['GET'])
 def get_users():
@@ -57,7 +90,14 @@ def get_users():
 
 @app.route('/character', methods=['GET'])
 def get_characters():
-    all_characters = Character.query.all()
+    ids = parse_ids(request.args.get("ids"))
+    snapshot_characters = catalog_table("character")
+    if snapshot_characters is not None:
+        all_characters = snapshot_characters.get_many(ids) if ids is not None else snapshot_characters.all()
+    elif ids is not None:
+        all_characters = get_by_ids(Character, ids)
+    else:
+        all_characters = Character.query.all()
     results_characters = list(map(lambda char: char.serialize(), all_characters))
 
     response_body = {
@@ -69,7 +109,14 @@ def get_characters():
 
 @app.route('/planet', methods=['GET'])
 def get_planets():
-    all_planets = Planet.query.all()
+    ids = parse_ids(request.args.get("ids"))
+    snapshot_planets = catalog_table("planet")
+    if snapshot_planets is not None:
+        all_planets = snapshot_planets.get_many(ids) if ids is not None else snapshot_planets.all()
+    elif ids is not None:
+        all_planets = get_by_ids(Planet, ids)
+    else:
+        all_planets = Planet.query.all()
     results_planets = list(map(lambda planet: planet.serialize(), all_planets))
 
     response_body = {
@@ -97,7 +144,11 @@ def get_user(user_id):
 
 @app.route('/character/<int:character_id>', methods=['GET'])
 def get_character(character_id):
-    character = Character.query.get(character_id)
+    snapshot_characters = catalog_table("character")
+    if snapshot_characters is not None:
+        character = snapshot_characters.get(character_id)
+    else:
+        character = Character.query.get(character_id)
 
     if character is None:
         return jsonify({"msg": "User not found"}), 404
@@ -264,6 +315,19 @@ def delete_planet(planet_id):
 
     return jsonify({"msg": "Planet deleted"}), 200
 
+@app.route('/user/<int:user_id>', methods=['DELETE'])
+def delete_user(user_id):
+    user = User.query.get(user_id)
+
+    if user is None:
+        return jsonify({"msg": "User not found"}), 404
+
+    # favorites and the favorites document go with it through ON DELETE CASCADE
+    db.session.delete(user)
+    db.session.commit()
+
+    return jsonify({"msg": "User deleted"}), 200
+
 #Añadir favoritos a User
 
 @app.route('/user/<int:user_id>/favorite/character/<int:character_id>', methods=['POST'])
@@ -362,33 +426,258 @@ def delete_favorite_planet(user_id, planet_id):
 
 @app.route('/user/<int:user_id>/favorites', methods=['GET'])
 def get_user_favorites(user_id):
+    if FAVORITES_DOCUMENT_ENABLED:
+        # precomputed document, one primary key lookup
+        body = get_document(user_id)
+        if body is None:
+            return jsonify({"msg": "User not found"}), 404
+        return Response(body, mimetype="application/json"), 200
+
     user = User.query.get(user_id)
 
     if user is None:
         return jsonify({"msg": "User not found"}), 404
 
-    all_fav_characters = Favorite_character.query.filter_by(user_id=user_id).all()
-    all_fav_planets = Favorite_planet.query.filter_by(user_id=user_id).all()
+    response_body = build_document(db.session, user_id)
+
+    return jsonify(response_body), 200
+
+#Buscar por nombre sin distinguir mayusculas
 
-    results_characters = list(map(
-        lambda fav: Character.query.get(fav.character_id).serialize(),
-        all_fav_characters
-    ))
+@app.route('/<any(character, planet, film, vehicle, specie):entity_type>/by-name/<name>', methods=['GET'])
+def get_by_name(entity_type, name):
+    model = CATALOG_MODELS[entity_type]
+    # lower() on both sides so the lower(name) index serves it. The unique
+    # constraint on name is case sensitive, when "Luke" and "LUKE" both exist
+    # the oldest one wins
+    item = model.query.filter(func.lower(model.name) == func.lower(name)).order_by(model.id).first()
 
-    results_planets = list(map(
-        lambda fav: Planet.query.get(fav.planet_id).serialize(),
-        all_fav_planets
-    ))
+    if item is None:
+        return jsonify({"msg": "{} not found".format(entity_type.capitalize())}), 404
+
+    return jsonify({
+        "msg": "Hello, this is your GET /{}/by-name/<name> response".format(entity_type),
+        entity_type: item.serialize()
+    }), 200
+
+@app.route('/<any(character, planet, film, vehicle, specie):entity_type>/by-name', methods=['GET'])
+def get_by_names(entity_type):
+    names = request.args.getlist("name")
+
+    if not names:
+        return jsonify({"msg": "at least one name is required, e.g. ?name=a&name=b"}), 400
+
+    if len(names) > BY_NAME_MAX_NAMES:
+        return jsonify({"msg": "at most {} names per request".format(BY_NAME_MAX_NAMES)}), 400
+
+    model = CATALOG_MODELS[entity_type]
+    found = model.query.filter(
+        func.lower(model.name).in_([func.lower(name) for name in names])
+    ).order_by(model.id).all()
+    # the oldest one wins between names that only differ in case, as in get_by_name
+    by_name = {}
+    for item in found:
+        by_name.setdefault(item.name.lower(), item)
+
+    results = []
+    missing = []
+    for name in names:
+        item = by_name.get(name.lower())
+        if item is None:
+            missing.append(name)
+        else:
+            results.append(item.serialize())
+
+    return jsonify({
+        "msg": "Hello, this is your GET /{}/by-name response".format(entity_type),
+        entity_type + "s": results,
+        "missing": missing
+    }), 200
+
+#Usuarios que tienen un elemento en favoritos
+
+@app.route('/<any(character, planet, film, vehicle, specie):entity_type>/<int:entity_id>/favorited-by', methods=['GET'])
+def get_favorited_by(entity_type, entity_id):
+    if db.session.get(CATALOG_MODELS[entity_type], entity_id) is None:
+        return jsonify({"msg": "{} not found".format(entity_type.capitalize())}), 404
+
+    favorite = FAVORITE_MODELS[entity_type]
+    favorite_entity_id = getattr(favorite, entity_type + "_id")
+
+    if request.args.get("count_only", "false").lower() in ("1", "true", "yes"):
+        # counted on the (<entity>_id, user_id) index alone, the table isn't read
+        count = db.session.query(func.count()).filter(favorite_entity_id == entity_id).scalar()
+        return jsonify({
+            "msg": "Hello, this is your GET /{}/<id>/favorited-by response".format(entity_type),
+            "count": count
+        }), 200
+
+    after = request.args.get("after", 0, type=int)
+    limit = request.args.get("limit", FAVORITED_BY_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, FAVORITED_BY_MAX_PAGE_SIZE))
+
+    # range scan on the (<entity>_id, user_id) index that comes out already
+    # sorted, so a page costs the same on page one and page ten thousand.
+    # One extra row tells us if there is more.
+    page = User.query.join(favorite, favorite.user_id == User.id).filter(
+        favorite_entity_id == entity_id,
+        favorite.user_id > after
+    ).order_by(favorite.user_id).limit(limit + 1).all()
+
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return jsonify({
+        "msg": "Hello, this is your GET /{}/<id>/favorited-by response".format(entity_type),
+        "users": [user.serialize() for user in page],
+        "next_cursor": page[-1].id if page else after,
+        "has_more": has_more
+    }), 200
+
+#Estado de la copia del catalogo en memoria de este worker
+
+@app.route('/snapshot', methods=['GET'])
+def get_snapshot():
+    stats = snapshot_stats()
+
+    if stats is None:
+        return jsonify({"msg": "Catalog snapshot is disabled"}), 404
+
+    return jsonify({
+        "msg": "Hello, this is your GET /snapshot response",
+        "snapshot": stats
+    }), 200
+
+#Sincronizacion incremental: cambios desde un cursor
+
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    since = request.args.get("since", 0, type=int)
+    limit = request.args.get("limit", CHANGES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, CHANGES_MAX_PAGE_SIZE))
+
+    # range scan on the primary key, one extra row tells us if there is more
+    page = Change.query.filter(Change.id > since).order_by(Change.id).limit(limit + 1).all()
+
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    # an entity touched several times in the page only needs its last change
+    latest = {}
+    for change in page:
+        latest.pop((change.entity_type, change.entity_id), None)
+        latest[(change.entity_type, change.entity_id)] = change
+
+    # current rows for inserts and updates, one IN query per entity type
+    wanted = {}
+    for change in latest.values():
+        if change.operation != "delete":
+            wanted.setdefault(change.entity_type, []).append(change.entity_id)
+
+    rows = {}
+    for entity_type, ids in wanted.items():
+        model = CATALOG_MODELS[entity_type]
+        for item in model.query.filter(model.id.in_(ids)).all():
+            rows[(entity_type, item.id)] = item
+
+    results_changes = []
+    for key, change in latest.items():
+        result = change.serialize()
+        if change.operation == "delete":
+            result["data"] = None
+        elif key in rows:
+            result["data"] = rows[key].serialize()
+        else:
+            # deleted after this page, its tombstone comes in a later one
+            continue
+        results_changes.append(result)
 
     response_body = {
-        "msg": "This is your GET /user/<id>/favorites response",
-        "user_id": user_id,
-        "favorite_characters": results_characters,
-        "favorite_planets": results_planets
+        "msg": "Hello, this is your GET /changes response ",
+        "changes": results_changes,
+        "next_cursor": page[-1].id if page else since,
+        "has_more": has_more
     }
 
     return jsonify(response_body), 200
 
+#Stream de cambios (Server-Sent Events)
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id is None:
+        last_event_id = request.args.get("last_event_id")
+
+    subscriber = bus.subscribe(last_event_id)
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            if subscriber.reset:
+                yield "id: {}\nevent: reset\ndata: {{}}\n\n".format(subscriber.event_id())
+            while not subscriber.dropped:
+                change = subscriber.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                if subscriber.dropped:
+                    break
+                if change is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "id: {}\nevent: change\ndata: {}\n\n".format(subscriber.event_id(), json.dumps(change))
+        finally:
+            bus.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+#Varias peticiones GET en una sola llamada
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    body = request.get_json(silent=True)
+
+    if not isinstance(body, dict) or not isinstance(body.get("requests"), list):
+        return jsonify({"msg": "requests must be a list of paths"}), 400
+
+    if len(body["requests"]) > BATCH_MAX_REQUESTS:
+        return jsonify({"msg": "at most {} requests per batch".format(BATCH_MAX_REQUESTS)}), 400
+
+    results = []
+    for item in body["requests"]:
+        path = item.get("path") if isinstance(item, dict) else item
+        if not isinstance(path, str) or not path.startswith("/"):
+            results.append({"path": path, "status": 400, "body": {"msg": "path must start with /"}})
+            continue
+
+        url = urlsplit(path)
+        if url.path.rstrip("/") in ("/batch", "/stream"):
+            results.append({"path": path, "status": 400, "body": {"msg": "{} can't be batched".format(url.path)}})
+            continue
+
+        # the sub request reuses this request's app context, so all of them
+        # share one db.session and its identity map
+        try:
+            with app.test_request_context(url.path, query_string=url.query, method="GET"):
+                response = app.full_dispatch_request()
+        except Exception:
+            app.logger.exception("Batch sub request to %s failed", path)
+            db.session.rollback()
+            results.append({"path": path, "status": 500, "body": {"msg": "Internal server error"}})
+            continue
+
+        results.append({
+            "path": path,
+            "status": response.status_code,
+            "body": response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+        })
+
+    return jsonify({
+        "msg": "Hello, this is your POST /batch response",
+        "responses": results
+    }), 200
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
@@ -0,0 +1,372 @@
+"""
+Change events for the /stream endpoint.
+
+Every committed change from the change logs is published as an event. Each
+worker keeps its own subscribers in memory and forwards the events it
+publishes to the other gunicorn workers through unix datagram sockets, one
+per worker process, living in a shared directory.
+
+An event id is the pair of positions in the two logs, "<catalog>:<favorite>".
+A client that reconnects with Last-Event-ID gets what it missed replayed
+from the change and favorite_change tables, so it doesn't matter which
+worker it lands on. When the gap is longer than a subscriber queue it gets a
+reset event instead and should resync: the catalog through /changes, the
+favorites it mirrors through /user/<id>/favorites.
+
+Favorites removed by ON DELETE CASCADE get no events of their own. A catalog
+delete means every favorite of that entity is gone, and a "user" delete in
+the favorite log means all of that user's favorites are.
+
+Datagrams can be lost when a peer's socket buffer is full, or arrive out of
+order from different workers, so every subscriber checks the versions it
+gets. Catalog versions are handed out in commit order (see
+models.record_changes), a skipped one is read from the change log right
+away. Favorite versions are not, a skipped one may belong to a transaction
+that hasn't committed yet: it is read when it shows up in the log, or given
+up after EVENTS_GAP_SECONDS. The favorite part of the event id stays below
+the oldest skipped version until then, so a resume replays from there and
+favorite events can repeat after a reconnect.
+"""
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from models import db, Change, Favorite_change, CATALOG_MODELS
+
+EVENTS_DIR = os.getenv("EVENTS_DIR", "/tmp/starwars-events")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", 100))
+EVENTS_GAP_SECONDS = float(os.getenv("EVENTS_GAP_SECONDS", 10))
+
+CHANGE_LOGS = {"catalog": Change, "favorite": Favorite_change}
+
+
+def change_log(change):
+    return "catalog" if change["entity_type"] in CATALOG_MODELS else "favorite"
+
+
+def parse_event_id(value):
+    """{"catalog": n, "favorite": m} from a Last-Event-ID, None if it isn't one of ours."""
+    parts = (value or "").split(":")
+    if len(parts) != 2 or not all(part.isascii() and part.isdigit() for part in parts):
+        return None
+    return {"catalog": int(parts[0]), "favorite": int(parts[1])}
+
+
+def format_event_id(cursor):
+    return "{}:{}".format(cursor["catalog"], cursor["favorite"])
+
+
+def log_heads(session):
+    return {
+        log: session.execute(select(func.max(model.id))).scalar() or 0
+        for log, model in CHANGE_LOGS.items()
+    }
+
+
+def load_changes(session, log, *conditions, limit=None):
+    """Events for the rows of a change log that match, oldest first."""
+    model = CHANGE_LOGS[log]
+    query = select(model).where(*conditions).order_by(model.id)
+    if limit is not None:
+        query = query.limit(limit)
+    changes = []
+    for row in session.execute(query).scalars():
+        change = {
+            "entity_type": row.entity_type,
+            "entity_id": row.entity_id,
+            "operation": row.operation,
+            "version": row.id
+        }
+        if log == "favorite":
+            change["user_id"] = row.user_id
+        changes.append(event_for(change))
+    return changes
+
+
+def load_missed(session, cursor, limit):
+    """Changes after cursor, oldest first in each log. None when there are more than limit."""
+    missed = []
+    for log, model in CHANGE_LOGS.items():
+        missed.extend(load_changes(session, log, model.id > cursor[log], limit=limit + 1))
+    return missed if len(missed) <= limit else None
+
+
+class Subscriber:
+    def __init__(self, queue_size, app=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = False
+        self.reset = False
+        # the change logs are read from the stream thread, outside the request
+        self.app = app
+        # catalog: version of the last event sent. favorite: every version up
+        # to it was sent or is known not to exist. Together the next event id.
+        self.cursor = None
+        # favorite versions above the cursor already dealt with
+        self.done = set()
+        # skipped favorite versions that may still commit, version -> deadline
+        self.holes = {}
+        # events checked and in order, waiting to be sent
+        self.ready = deque()
+        self.lock = threading.Lock()
+        # live events wait here while the replay is read from the database
+        self.pending = []
+
+    def get(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.ready and not self.dropped:
+            self._expire_holes()
+            if self.ready:
+                break
+            wait = deadline - time.monotonic()
+            if self.holes:
+                wait = min(wait, min(self.holes.values()) - time.monotonic())
+            try:
+                change = self.queue.get(timeout=max(wait, 0))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    return None
+                continue
+            self._accept(change)
+        return self.ready.popleft() if self.ready else None
+
+    def event_id(self):
+        return format_event_id(self.cursor)
+
+    def offer(self, change):
+        """Queues a live event, False when the queue is full."""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(change)
+                return True
+            return self._put(change)
+
+    def go_live(self, missed):
+        with self.lock:
+            for change in missed:
+                self.queue.put_nowait(change)
+            pending, self.pending = self.pending, None
+            return all([self._put(change) for change in pending])
+
+    def _put(self, change):
+        try:
+            self.queue.put_nowait(change)
+            return True
+        except queue.Full:
+            self.dropped = True
+            return False
+
+    def _load(self, log, *conditions):
+        with self.app.app_context():
+            return load_changes(db.session, log, *conditions)
+
+    def _too_far(self, gap):
+        if gap > self.queue.maxsize:
+            # more than a queue behind, the client reconnects and resumes
+            # from its event id like a slow consumer
+            self.dropped = True
+            return True
+        return False
+
+    def _accept(self, change):
+        # the replay, the gap reads and the live datagrams can overlap, and
+        # datagrams from different workers can come out of order
+        log = change_log(change)
+        version = change["version"]
+        model = CHANGE_LOGS[log]
+
+        if log == "catalog":
+            last = self.cursor["catalog"]
+            if version <= last:
+                return
+            if version > last + 1:
+                if self._too_far(version - last - 1):
+                    return
+                # handed out in commit order, whatever is in between is
+                # committed (or rolled back and never will be)
+                self.ready.extend(self._load(log, model.id > last, model.id < version))
+            self.ready.append(change)
+            self.cursor["catalog"] = version
+            return
+
+        if version <= self.cursor["favorite"] or version in self.done:
+            return
+        top = max(self.done, default=self.cursor["favorite"])
+        if version > top + 1:
+            if self._too_far(version - top - 1):
+                return
+            found = self._load(log, model.id > top, model.id < version)
+            self._send_favorites(found)
+            missing = set(range(top + 1, version)) - {change["version"] for change in found}
+            deadline = time.monotonic() + EVENTS_GAP_SECONDS
+            for skipped in missing:
+                self.holes[skipped] = deadline
+        self._send_favorites([change])
+
+    def _send_favorites(self, changes):
+        for change in changes:
+            if change["version"] in self.done or change["version"] <= self.cursor["favorite"]:
+                continue
+            self.ready.append(change)
+            self.done.add(change["version"])
+            self.holes.pop(change["version"], None)
+        self._advance()
+
+    def _expire_holes(self):
+        now = time.monotonic()
+        expired = [version for version, deadline in self.holes.items() if deadline <= now]
+        if not expired:
+            return
+        self._send_favorites(self._load("favorite", Favorite_change.id.in_(expired)))
+        for version in expired:
+            if self.holes.pop(version, None) is not None:
+                # rolled back, or a transaction longer than EVENTS_GAP_SECONDS
+                self.done.add(version)
+        self._advance()
+
+    def _advance(self):
+        while self.cursor["favorite"] + 1 in self.done:
+            self.cursor["favorite"] += 1
+            self.done.discard(self.cursor["favorite"])
+
+
+class EventBus:
+    def __init__(self, directory=EVENTS_DIR, queue_size=EVENTS_QUEUE_SIZE):
+        self.directory = directory
+        self.queue_size = queue_size
+        self.subscribers = set()
+        # in-process callbacks that see every change, e.g. the catalog snapshot
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.pid = None
+        self.sock = None
+        self.sender = None
+
+    def _ensure_started(self):
+        # the socket and reader thread belong to one process, a forked
+        # worker starts its own on first use
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, "%d.sock" % os.getpid())
+            if os.path.exists(path):
+                os.unlink(path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(path)
+            self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sender.setblocking(False)
+            self.subscribers = set()
+            self.pid = os.getpid()
+            threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        sock = self.sock
+        while True:
+            data = sock.recv(65536)
+            self._deliver(json.loads(data))
+
+    def _deliver(self, change):
+        with self.lock:
+            subscribers = list(self.subscribers)
+
+        for listener in self.listeners:
+            listener(change)
+
+        for subscriber in subscribers:
+            if not subscriber.offer(change):
+                # slow consumer, drop it instead of letting its queue grow
+                self.unsubscribe(subscriber)
+
+    def publish(self, changes):
+        self._ensure_started()
+        own = "%d.sock" % self.pid
+        peers = [name for name in os.listdir(self.directory) if name.endswith(".sock") and name != own]
+
+        for change in changes:
+            self._deliver(change)
+            data = json.dumps(change).encode()
+            for name in list(peers):
+                try:
+                    self.sender.sendto(data, os.path.join(self.directory, name))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # the worker is gone, clean up its socket
+                    try:
+                        os.unlink(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+                    peers.remove(name)
+                except BlockingIOError:
+                    # the peer socket buffer is full, that worker misses it
+                    pass
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        self._ensure_started()
+
+    def subscribe(self, last_event_id=None):
+        """Subscribes from a Last-Event-ID, needs an app context for the replay."""
+        self._ensure_started()
+        subscriber = Subscriber(self.queue_size, current_app._get_current_object())
+
+        # registered before the logs are read so nothing committed in
+        # between is lost, the live events wait in pending meanwhile
+        with self.lock:
+            self.subscribers.add(subscriber)
+
+        heads = log_heads(db.session)
+        cursor = parse_event_id(last_event_id) if last_event_id is not None else None
+        subscriber.cursor = cursor or heads
+        missed = []
+        if last_event_id is not None:
+            missed = load_missed(db.session, cursor, self.queue_size) if cursor is not None else None
+            if missed is None:
+                # unknown id or a gap longer than the queue, the client
+                # has to resync through /changes
+                subscriber.reset = True
+                subscriber.cursor = heads
+                missed = []
+
+        if not subscriber.go_live(missed):
+            self.unsubscribe(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+
+bus = EventBus()
+
+
+@event.listens_for(Session, "after_commit")
+def publish_changes(session):
+    changes = session.info.pop("changes", None)
+    if changes:
+        bus.publish([event_for(change) for change in changes])
+
+
+def event_for(change):
+    result = {
+        "entity_type": change["entity_type"],
+        "id": change["entity_id"],
+        "operation": change["operation"],
+        "version": change["version"]
+    }
+    if "user_id" in change:
+        result["user_id"] = change["user_id"]
+    return result
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_changes(session, previous_transaction):
+    session.info.pop("changes", None)
@@ -0,0 +1,223 @@
+"""
+Materialized GET /user/<id>/favorites documents.
+
+With FAVORITES_DOCUMENT_ENABLED the response for each user is kept
+pre-serialized in the favorites_document table and served with a single
+primary key lookup. A flush hook patches the stored document when one of
+the user's favorites is added or removed, in the same transaction as the
+write. When a favorited entity is updated or deleted, or a favorite moves,
+the documents it touches are emptied with one UPDATE and built again on
+their next read, instead of rewriting every one of them in the write.
+
+Documents are built on read, with the row claimed and locked first so a
+favorite written during the build is either in it or patched after it.
+After turning the feature on, or when a write skipped the ORM, fix them with:
+
+    flask favorites rebuild [--user-id ID]
+    flask favorites check [--fix]
+"""
+import json
+import os
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, User, Favorites_document, CATALOG_MODELS, CATALOG_TYPES, FAVORITE_MODELS
+
+FAVORITES_DOCUMENT_ENABLED = os.getenv("FAVORITES_DOCUMENT_ENABLED", "false").lower() in ("1", "true", "yes")
+
+FAVORITE_TYPES = {model: entity_type for entity_type, model in FAVORITE_MODELS.items()}
+
+favorites_cli = AppGroup("favorites", help="Manage the precomputed favorites documents.")
+
+
+def document_key(entity_type):
+    return "favorite_" + entity_type + "s"
+
+
+def build_document(session, user_id):
+    document = {
+        "msg": "This is your GET /user/<id>/favorites response",
+        "user_id": user_id
+    }
+    for entity_type, model in CATALOG_MODELS.items():
+        favorite = FAVORITE_MODELS[entity_type]
+        entities = session.execute(
+            select(model)
+            .join(favorite, getattr(favorite, entity_type + "_id") == model.id)
+            .where(favorite.user_id == user_id)
+            .order_by(favorite.id)
+        ).scalars()
+        document[document_key(entity_type)] = [entity.serialize() for entity in entities]
+    return document
+
+
+def dump(document):
+    return json.dumps(document, separators=(",", ":"))
+
+
+def get_document(user_id):
+    """Stored body for a user, built and saved when it's missing or emptied. None if the user doesn't exist."""
+    stored = db.session.get(Favorites_document, user_id)
+    if stored is not None and stored.body is not None:
+        return stored.body
+
+    if stored is None:
+        if db.session.get(User, user_id) is None:
+            return None
+        # claim the row before reading the favorites, from here on every
+        # favorite write finds it and locks it
+        db.session.add(Favorites_document(user_id=user_id))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # another request claimed it first
+            db.session.rollback()
+
+    # writers that got the lock first are committed and in the build, the
+    # ones after it wait and patch the built document
+    table = Favorites_document.__table__
+    row = db.session.execute(
+        select(table.c.body).where(table.c.user_id == user_id).with_for_update()
+    ).first()
+    if row is None:
+        # the user was deleted in the meantime
+        db.session.commit()
+        return None
+    body = row.body
+    if body is None:
+        body = dump(build_document(db.session, user_id))
+        db.session.execute(
+            table.update().where(table.c.user_id == user_id).values(body=body, updated_at=func.now())
+        )
+    db.session.commit()
+    return body
+
+
+def patch_documents(session, user_ids, change):
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    table = Favorites_document.__table__
+    connection = session.connection()
+    rows = connection.execute(
+        select(table.c.user_id, table.c.body).where(table.c.user_id.in_(user_ids)).with_for_update()
+    ).all()
+    for user_id, body in rows:
+        if body is None:
+            # emptied or still being built, the build picks this write up
+            continue
+        document = json.loads(body)
+        change(document)
+        connection.execute(
+            table.update().where(table.c.user_id == user_id).values(body=dump(document), updated_at=func.now())
+        )
+
+
+def add_entry(entity_type, entity):
+    def change(document):
+        entries = document[document_key(entity_type)]
+        if all(entry["id"] != entity["id"] for entry in entries):
+            entries.append(entity)
+    return change
+
+
+def remove_entry(entity_type, entity_id):
+    def change(document):
+        key = document_key(entity_type)
+        document[key] = [entry for entry in document[key] if entry["id"] != entity_id]
+    return change
+
+
+def invalidate_documents(session, user_ids):
+    """Empties the documents of user_ids (a list or a select of ids) in one UPDATE."""
+    table = Favorites_document.__table__
+    session.connection().execute(
+        table.update().where(table.c.user_id.in_(user_ids), table.c.body.is_not(None)).values(body=None, updated_at=func.now())
+    )
+
+
+def favorited_by(entity_type, entity_id):
+    favorite = FAVORITE_MODELS[entity_type]
+    return select(favorite.user_id).where(getattr(favorite, entity_type + "_id") == entity_id)
+
+
+@event.listens_for(Session, "before_flush")
+def invalidate_deleted_entities(session, flush_context, instances):
+    if not FAVORITES_DOCUMENT_ENABLED:
+        return
+    # the favorites of a deleted entity are gone after the flush, so empty
+    # the documents of who had it before
+    for obj in session.deleted:
+        entity_type = CATALOG_TYPES.get(type(obj))
+        if entity_type is not None:
+            invalidate_documents(session, favorited_by(entity_type, obj.id))
+
+
+@event.listens_for(Session, "after_flush")
+def update_documents(session, flush_context):
+    if not FAVORITES_DOCUMENT_ENABLED:
+        return
+
+    with session.no_autoflush:
+        for obj in session.new:
+            entity_type = FAVORITE_TYPES.get(type(obj))
+            if entity_type is not None:
+                entity = session.get(CATALOG_MODELS[entity_type], getattr(obj, entity_type + "_id"))
+                patch_documents(session, [obj.user_id], add_entry(entity_type, entity.serialize()))
+
+        for obj in session.deleted:
+            entity_type = FAVORITE_TYPES.get(type(obj))
+            if entity_type is not None:
+                patch_documents(session, [obj.user_id], remove_entry(entity_type, getattr(obj, entity_type + "_id")))
+
+        for obj in session.dirty:
+            if not session.is_modified(obj, include_collections=False):
+                continue
+            entity_type = CATALOG_TYPES.get(type(obj))
+            if entity_type is not None:
+                invalidate_documents(session, favorited_by(entity_type, obj.id))
+            elif type(obj) in FAVORITE_TYPES:
+                # a favorite moved to another user or entity, empty both sides
+                history = inspect(obj).attrs.user_id.history
+                invalidate_documents(session, list(set(history.deleted or ()) | {obj.user_id}))
+
+
+@favorites_cli.command("rebuild")
+@click.option("--user-id", type=int, help="Only rebuild this user's document.")
+def rebuild(user_id):
+    """Build the favorites document of every user from the favorite tables."""
+    user_ids = [user_id] if user_id is not None else db.session.execute(select(User.id)).scalars().all()
+    for count, current in enumerate(user_ids, 1):
+        body = dump(build_document(db.session, current))
+        stored = db.session.get(Favorites_document, current)
+        if stored is None:
+            db.session.add(Favorites_document(user_id=current, body=body))
+        else:
+            stored.body = body
+        if count % 500 == 0:
+            db.session.commit()
+    db.session.commit()
+    click.echo("Rebuilt {} favorites documents".format(len(user_ids)))
+
+
+@favorites_cli.command("check")
+@click.option("--fix", is_flag=True, help="Rebuild the documents that don't match.")
+def check(fix):
+    """Compare every stored document with the favorite tables."""
+    mismatched = []
+    # emptied documents are built on their next read, nothing to compare
+    for stored in db.session.execute(select(Favorites_document).where(Favorites_document.body.is_not(None))).scalars():
+        if json.loads(stored.body) != build_document(db.session, stored.user_id):
+            mismatched.append(stored)
+
+    for stored in mismatched:
+        click.echo("User {}: stored favorites document is out of date".format(stored.user_id))
+        if fix:
+            stored.body = dump(build_document(db.session, stored.user_id))
+    db.session.commit()
+
+    click.echo("{} documents out of date{}".format(len(mismatched), ", fixed" if fix and mismatched else ""))
+    if mismatched and not fix:
+        raise SystemExit(1)
@@ -0,0 +1,117 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request with a key claims it in the idempotency_key table, runs
+normally and stores its status and body. A retry with the same key gets the
+stored response back without running the handler, so nothing is validated,
+inserted or committed twice. Keys expire after IDEMPOTENCY_TTL_SECONDS and
+the table is capped at IDEMPOTENCY_MAX_KEYS rows.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta
+from flask import Response, g, jsonify, request
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from models import db, Idempotency_key
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000))
+# a claim without a response after this long belongs to a dead worker
+IDEMPOTENCY_LOCK_SECONDS = 60
+# expired and extra keys are pruned once every this many stored responses
+PRUNE_EVERY = 100
+
+_stored = 0
+
+
+def fingerprint():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.full_path.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def replay_stored_response():
+    """before_request hook: returns the stored response for a known key."""
+    key = request.headers.get("Idempotency-Key")
+    if request.method != "POST" or not key:
+        return None
+
+    if len(key) > 255:
+        return jsonify({"msg": "Idempotency-Key is too long"}), 400
+
+    now = datetime.now()
+    request_fingerprint = fingerprint()
+    stored = db.session.get(Idempotency_key, key)
+
+    if stored is not None and (
+        stored.created_at < now - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        or (stored.status_code is None and stored.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS))
+    ):
+        db.session.delete(stored)
+        db.session.commit()
+        stored = None
+
+    if stored is None:
+        # claim the key before running the handler, a concurrent retry
+        # with the same key loses the insert race
+        db.session.add(Idempotency_key(key=key, fingerprint=request_fingerprint, created_at=now))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"msg": "A request with this Idempotency-Key is in progress"}), 409
+        g.idempotency_key = key
+        return None
+
+    if stored.fingerprint != request_fingerprint:
+        return jsonify({"msg": "Idempotency-Key was already used for a different request"}), 422
+
+    if stored.status_code is None:
+        return jsonify({"msg": "A request with this Idempotency-Key is in progress"}), 409
+
+    return Response(stored.response_body, status=stored.status_code, mimetype="application/json",
+                    headers={"Idempotent-Replayed": "true"})
+
+
+def store_response(response):
+    """after_request hook: keeps the response of the request that claimed a key."""
+    # batch sub requests are GETs that share g with the POST that claimed it
+    if request.method != "POST":
+        return response
+
+    key = g.pop("idempotency_key", None)
+    if key is None:
+        return response
+
+    # the handler may have left the session in a failed transaction
+    db.session.rollback()
+
+    if response.status_code >= 500:
+        # let the client retry for real
+        db.session.execute(delete(Idempotency_key).where(Idempotency_key.key == key))
+    else:
+        stored = db.session.get(Idempotency_key, key)
+        stored.status_code = response.status_code
+        stored.response_body = response.get_data(as_text=True)
+    db.session.commit()
+
+    global _stored
+    _stored += 1
+    if _stored % PRUNE_EVERY == 0:
+        prune()
+
+    return response
+
+
+def prune():
+    cutoff = datetime.now() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    db.session.execute(delete(Idempotency_key).where(Idempotency_key.created_at < cutoff))
+
+    # past the cap the oldest keys go first
+    newest = select(Idempotency_key.created_at).order_by(Idempotency_key.created_at.desc()) \
+        .offset(IDEMPOTENCY_MAX_KEYS - 1).limit(1).scalar_subquery()
+    db.session.execute(delete(Idempotency_key).where(Idempotency_key.created_at < newest))
+    db.session.commit()
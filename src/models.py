@@ -1,12 +1,24 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import String, Boolean
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import String, Boolean, DateTime
+from sqlalchemy.orm import Mapped, mapped_column, Session
 from sqlalchemy.orm import relationship
-from typing import List
-from sqlalchemy import ForeignKey
+from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import ForeignKey, Index, event, func, select
+from sqlalchemy.engine import Engine
+import sqlite3
 
 db = SQLAlchemy()
 
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # sqlite ignores foreign keys, and so ON DELETE CASCADE, unless asked
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 class User(db.Model):
     __tablename__ = "user"
 
@@ -16,11 +28,11 @@ class User(db.Model):
     user_name: Mapped[str] = mapped_column(nullable=False)
 
     #relationships
-    favorites_characters: Mapped[List["Favorite_character"]] = relationship(back_populates="user_favorites_character")
-    favorites_planets: Mapped[List["Favorite_planet"]] = relationship(back_populates="user_favorites_planet")
-    favorites_films: Mapped[List["Favorite_film"]] = relationship(back_populates="user_favorites_film")
-    favorites_vehicles: Mapped[List["Favorite_vehicle"]] = relationship(back_populates="user_favorites_vehicle")
-    favorites_species: Mapped[List["Favorite_specie"]] = relationship(back_populates="user_favorites_specie")
+    favorites_characters: Mapped[List["Favorite_character"]] = relationship(back_populates="user_favorites_character", cascade="all, delete-orphan", passive_deletes=True)
+    favorites_planets: Mapped[List["Favorite_planet"]] = relationship(back_populates="user_favorites_planet", cascade="all, delete-orphan", passive_deletes=True)
+    favorites_films: Mapped[List["Favorite_film"]] = relationship(back_populates="user_favorites_film", cascade="all, delete-orphan", passive_deletes=True)
+    favorites_vehicles: Mapped[List["Favorite_vehicle"]] = relationship(back_populates="user_favorites_vehicle", cascade="all, delete-orphan", passive_deletes=True)
+    favorites_species: Mapped[List["Favorite_specie"]] = relationship(back_populates="user_favorites_specie", cascade="all, delete-orphan", passive_deletes=True)
 
 
     def serialize(self):
@@ -38,9 +50,11 @@ class Character(db.Model):
     name: Mapped[str] = mapped_column(String(120), unique=True, nullable=False)
     description: Mapped[str] = mapped_column(nullable=False)
     imageLink: Mapped[str] = mapped_column(nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
 
     #relationships
-    characters: Mapped[List["Favorite_character"]] = relationship(back_populates="favorite_character")
+    characters: Mapped[List["Favorite_character"]] = relationship(back_populates="favorite_character", cascade="all, delete-orphan", passive_deletes=True)
 
 
     def serialize(self):
@@ -58,9 +72,11 @@ class Planet(db.Model):
     name: Mapped[str] = mapped_column(String(120), unique=True, nullable=False)
     description: Mapped[str] = mapped_column(nullable=False)
     imageLink: Mapped[str] = mapped_column(nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
 
     #relationships
-    planets: Mapped[List["Favorite_planet"]] = relationship(back_populates="planet_favorite")
+    planets: Mapped[List["Favorite_planet"]] = relationship(back_populates="planet_favorite", cascade="all, delete-orphan", passive_deletes=True)
 
 
     def serialize(self):
@@ -78,9 +94,11 @@ class Film(db.Model):
     name: Mapped[str] = mapped_column(String(120), unique=True, nullable=False)
     description: Mapped[str] = mapped_column(nullable=False)
     imageLink: Mapped[str] = mapped_column(nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
 
     #relationships
-    films: Mapped[List["Favorite_film"]] = relationship(back_populates="film_favorite")
+    films: Mapped[List["Favorite_film"]] = relationship(back_populates="film_favorite", cascade="all, delete-orphan", passive_deletes=True)
 
     def serialize(self):
         return {
@@ -97,9 +115,11 @@ class Vehicle(db.Model):
     name: Mapped[str] = mapped_column(String(120), unique=True, nullable=False)
     description: Mapped[str] = mapped_column(nullable=False)
     imageLink: Mapped[str] = mapped_column(nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
 
     #relationships
-    vehicles: Mapped[List["Favorite_vehicle"]] = relationship(back_populates="vehicle_favorite")
+    vehicles: Mapped[List["Favorite_vehicle"]] = relationship(back_populates="vehicle_favorite", cascade="all, delete-orphan", passive_deletes=True)
 
     def serialize(self):
         return {
@@ -116,9 +136,11 @@ class Specie(db.Model):
     name: Mapped[str] = mapped_column(String(120), unique=True, nullable=False)
     description: Mapped[str] = mapped_column(nullable=False)
     imageLink: Mapped[str] = mapped_column(nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
 
     #relationships
-    species: Mapped[List["Favorite_specie"]] = relationship(back_populates="specie_favorite")
+    species: Mapped[List["Favorite_specie"]] = relationship(back_populates="specie_favorite", cascade="all, delete-orphan", passive_deletes=True)
 
     def serialize(self):
         return {
@@ -132,12 +154,18 @@ class Specie(db.Model):
 
 class Favorite_character(db.Model):
     __tablename__ = "favorite_character"
+    # a user's favorites and the "already in favorites" check, the
+    # second one lets ON DELETE CASCADE find an entity's favorites
+    __table_args__ = (
+        Index("ix_favorite_character_user_id_character_id", "user_id", "character_id"),
+        Index("ix_favorite_character_character_id_user_id", "character_id", "user_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
     #foreign keys
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable = False)
-    character_id: Mapped[int] = mapped_column(ForeignKey("character.id"),nullable = False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), nullable = False)
+    character_id: Mapped[int] = mapped_column(ForeignKey("character.id", ondelete="CASCADE"), nullable = False)
 
     #relationships
     user_favorites_character: Mapped["User"] = relationship(back_populates="favorites_characters")
@@ -153,13 +181,19 @@ class Favorite_character(db.Model):
 
 class Favorite_planet(db.Model):
     __tablename__ = "favorite_planet"
+    # a user's favorites and the "already in favorites" check, the
+    # second one lets ON DELETE CASCADE find an entity's favorites
+    __table_args__ = (
+        Index("ix_favorite_planet_user_id_planet_id", "user_id", "planet_id"),
+        Index("ix_favorite_planet_planet_id_user_id", "planet_id", "user_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
 
     #foreign keys
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable = False)
-    planet_id: Mapped[int] = mapped_column(ForeignKey("planet.id"), nullable = False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), nullable = False)
+    planet_id: Mapped[int] = mapped_column(ForeignKey("planet.id", ondelete="CASCADE"), nullable = False)
 
     #relationships
     user_favorites_planet: Mapped["User"] = relationship(back_populates="favorites_planets")
@@ -175,13 +209,19 @@ class Favorite_planet(db.Model):
     
 class Favorite_film(db.Model):
     __tablename__ = "favorite_film"
+    # a user's favorites and the "already in favorites" check, the
+    # second one lets ON DELETE CASCADE find an entity's favorites
+    __table_args__ = (
+        Index("ix_favorite_film_user_id_film_id", "user_id", "film_id"),
+        Index("ix_favorite_film_film_id_user_id", "film_id", "user_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
 
     #foreign keys
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable = False)
-    film_id: Mapped[int] = mapped_column(ForeignKey("film.id"), nullable = False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), nullable = False)
+    film_id: Mapped[int] = mapped_column(ForeignKey("film.id", ondelete="CASCADE"), nullable = False)
 
     #relationships
     user_favorites_film: Mapped["User"] = relationship(back_populates="favorites_films")
@@ -197,13 +237,19 @@ class Favorite_film(db.Model):
     
 class Favorite_vehicle(db.Model):
     __tablename__ = "favorite_vehicle"
+    # a user's favorites and the "already in favorites" check, the
+    # second one lets ON DELETE CASCADE find an entity's favorites
+    __table_args__ = (
+        Index("ix_favorite_vehicle_user_id_vehicle_id", "user_id", "vehicle_id"),
+        Index("ix_favorite_vehicle_vehicle_id_user_id", "vehicle_id", "user_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
 
     #foreign keys
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable = False)
-    vehicle_id: Mapped[int] = mapped_column(ForeignKey("vehicle.id"), nullable = False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), nullable = False)
+    vehicle_id: Mapped[int] = mapped_column(ForeignKey("vehicle.id", ondelete="CASCADE"), nullable = False)
 
     #relationships
     user_favorites_vehicle: Mapped["User"] = relationship(back_populates="favorites_vehicles")
@@ -219,13 +265,19 @@ class Favorite_vehicle(db.Model):
     
 class Favorite_specie(db.Model):
     __tablename__ = "favorite_specie"
+    # a user's favorites and the "already in favorites" check, the
+    # second one lets ON DELETE CASCADE find an entity's favorites
+    __table_args__ = (
+        Index("ix_favorite_specie_user_id_specie_id", "user_id", "specie_id"),
+        Index("ix_favorite_specie_specie_id_user_id", "specie_id", "user_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
 
     #foreign keys
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable = False)
-    specie_id: Mapped[int] = mapped_column(ForeignKey("specie.id"), nullable = False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), nullable = False)
+    specie_id: Mapped[int] = mapped_column(ForeignKey("specie.id", ondelete="CASCADE"), nullable = False)
 
     user_favorites_specie: Mapped["User"] = relationship(back_populates="favorites_species")
     specie_favorite: Mapped["Specie"] = relationship(back_populates="species")
@@ -236,4 +288,177 @@ class Favorite_specie(db.Model):
             "id": self.id,
             "user_id": self.user_id,
             "specie_id": self.specie_id
-        }
\ No newline at end of file
+        }
+
+#Registro de cambios para la sincronizacion incremental
+
+class Change(db.Model):
+    __tablename__ = "change"
+    # AUTOINCREMENT keeps sqlite from reusing ids, the id is the sync cursor
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    entity_type: Mapped[str] = mapped_column(String(40), nullable=False)
+    entity_id: Mapped[int] = mapped_column(nullable=False)
+    operation: Mapped[str] = mapped_column(String(10), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), nullable=False)
+
+
+    def serialize(self):
+        return {
+            "cursor": self.id,
+            "entity_type": self.entity_type,
+            "id": self.entity_id,
+            "operation": self.operation,
+            "changed_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+
+#Log de cambios de favoritos, aparte del catalogo
+
+class Favorite_change(db.Model):
+    __tablename__ = "favorite_change"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    entity_type: Mapped[str] = mapped_column(String(40), nullable=False)
+    entity_id: Mapped[int] = mapped_column(nullable=False)
+    user_id: Mapped[int] = mapped_column(nullable=False)
+    operation: Mapped[str] = mapped_column(String(10), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), nullable=False)
+
+
+CATALOG_MODELS = {
+    "character": Character,
+    "planet": Planet,
+    "film": Film,
+    "vehicle": Vehicle,
+    "specie": Specie
+}
+
+# lower(name) and lower(email) indexes for the case insensitive lookups by
+# name and the admin AJAX prefix searches, which sqlite walks as a range.
+# postgres only serves LIKE 'term%' from an index with text_pattern_ops
+# whatever the database collation is, and that one serves equality too, so
+# it gets those instead of both
+for entity_type, model in CATALOG_MODELS.items():
+    Index("ix_{}_name_lower".format(entity_type), func.lower(model.name)).ddl_if(dialect="sqlite")
+Index("ix_user_email_lower", func.lower(User.email)).ddl_if(dialect="sqlite")
+for model, column in [(User, User.email)] + [(model, model.name) for model in CATALOG_MODELS.values()]:
+    Index(
+        "ix_{}_{}_lower_pattern".format(model.__tablename__, column.key),
+        func.lower(column).label("lower_pattern"),
+        postgresql_ops={"lower_pattern": "text_pattern_ops"}
+    ).ddl_if(dialect="postgresql")
+
+FAVORITE_MODELS = {
+    "character": Favorite_character,
+    "planet": Favorite_planet,
+    "film": Favorite_film,
+    "vehicle": Favorite_vehicle,
+    "specie": Favorite_specie
+}
+
+CATALOG_TYPES = {model: entity_type for entity_type, model in CATALOG_MODELS.items()}
+FAVORITE_CHANGE_TYPES = {model: "favorite_" + entity_type for entity_type, model in FAVORITE_MODELS.items()}
+
+# advisory lock key that serializes change log writers on postgres
+CHANGE_LOCK_ID = 26
+
+
+@event.listens_for(Session, "after_flush")
+def record_changes(session, flush_context):
+    # Every insert, update and delete of a catalog or favorite row gets a row
+    # in a change log, inside the same transaction as the write itself.
+    # The logged changes wait in session.info until the commit publishes them.
+    #
+    # Favorites removed by ON DELETE CASCADE never reach the session and get
+    # no row of their own: a catalog delete already says every favorite of
+    # that entity is gone, and a user delete is logged once in
+    # favorite_change as entity_type "user", for all of that user's favorites.
+    catalog_rows = []
+    favorite_rows = []
+    for operation, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if operation == "update" and not session.is_modified(obj, include_collections=False):
+                continue
+            if type(obj) in CATALOG_TYPES:
+                catalog_rows.append({
+                    "entity_type": CATALOG_TYPES[type(obj)],
+                    "entity_id": obj.id,
+                    "operation": operation
+                })
+            elif type(obj) in FAVORITE_CHANGE_TYPES:
+                favorite_rows.append({
+                    "entity_type": FAVORITE_CHANGE_TYPES[type(obj)],
+                    "entity_id": obj.id,
+                    "user_id": obj.user_id,
+                    "operation": operation
+                })
+            elif isinstance(obj, User) and operation == "delete":
+                favorite_rows.append({
+                    "entity_type": "user",
+                    "entity_id": obj.id,
+                    "user_id": obj.id,
+                    "operation": operation
+                })
+
+    if not catalog_rows and not favorite_rows:
+        return
+
+    connection = session.connection()
+    changes = session.info.setdefault("changes", [])
+    if catalog_rows:
+        if connection.dialect.name == "postgresql":
+            # serial ids are handed out before commit, so two concurrent writers
+            # could commit out of order and a /changes client would skip the
+            # lower cursor. Holding a transaction lock makes id order match
+            # commit order.
+            connection.execute(select(func.pg_advisory_xact_lock(CHANGE_LOCK_ID)))
+        changes.extend(log_changes(connection, Change, catalog_rows))
+    if favorite_rows:
+        # favorites are the hottest writes and /changes doesn't serve them,
+        # they get their own table and sequence and don't take the lock
+        changes.extend(log_changes(connection, Favorite_change, favorite_rows))
+
+
+def log_changes(connection, model, rows):
+    # every column comes back with its id, so the rows don't have to return
+    # in parameter order and sqlite keeps it to one INSERT
+    table = model.__table__
+    result = connection.execute(
+        table.insert().returning(table.c.id, *(table.c[key] for key in rows[0])),
+        rows
+    )
+    logged = []
+    for row in sorted(result.mappings(), key=lambda row: row["id"]):
+        change = dict(row)
+        change["version"] = change.pop("id")
+        logged.append(change)
+    return logged
+
+
+
+#Respuestas guardadas por Idempotency-Key
+
+class Idempotency_key(db.Model):
+    __tablename__ = "idempotency_key"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    # empty while the first request is still running
+    status_code: Mapped[Optional[int]] = mapped_column(nullable=True)
+    response_body: Mapped[Optional[str]] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+#Documento de favoritos precalculado por usuario
+
+class Favorites_document(db.Model):
+    __tablename__ = "favorites_document"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    # the whole GET /user/<id>/favorites response, already serialized. Empty
+    # while it's being built or after a write emptied it.
+    body: Mapped[Optional[str]] = mapped_column(nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
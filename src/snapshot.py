@@ -0,0 +1,164 @@
+"""
+Read-only in-memory copy of the catalog.
+
+With SNAPSHOT_ENABLED every worker loads the catalog tables into compact
+__slots__ records with an id -> offset index, and the list, get and ?ids=
+endpoints are served from it without touching the database.
+
+The version of a snapshot is the last catalog change id from the change
+log. Committed catalog changes reach every worker on the host through the
+event bus, and a worker whose snapshot is older loads a new one and swaps it
+in with a single assignment. Requests never see a half built snapshot.
+Changes made on another host are picked up by checking the change log every
+SNAPSHOT_DB_CHECK_SECONDS.
+"""
+import os
+import sys
+import threading
+import time
+from flask import current_app
+from sqlalchemy import func, select
+from events import bus
+from models import db, Change, CATALOG_MODELS
+
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "false").lower() in ("1", "true", "yes")
+SNAPSHOT_DB_CHECK_SECONDS = float(os.getenv("SNAPSHOT_DB_CHECK_SECONDS", 30))
+
+
+class CatalogRecord:
+    __slots__ = ("id", "name", "description", "imageLink")
+
+    def __init__(self, id, name, description, imageLink):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.imageLink = imageLink
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "imageLink": self.imageLink
+        }
+
+
+class CatalogTable:
+    __slots__ = ("records", "offsets")
+
+    def __init__(self, records):
+        self.records = tuple(records)
+        self.offsets = {record.id: offset for offset, record in enumerate(self.records)}
+
+    def all(self):
+        return self.records
+
+    def get(self, record_id):
+        offset = self.offsets.get(record_id)
+        return None if offset is None else self.records[offset]
+
+    def get_many(self, ids):
+        # same contract as utils.get_by_ids: requested order, unknown ids skipped
+        return [self.records[self.offsets[record_id]] for record_id in ids if record_id in self.offsets]
+
+
+class CatalogSnapshot:
+    __slots__ = ("version", "tables", "loaded_at")
+
+    def __init__(self, version, tables):
+        self.version = version
+        self.tables = tables
+        self.loaded_at = time.time()
+
+    def size_bytes(self):
+        size = sys.getsizeof(self.tables)
+        for table in self.tables.values():
+            size += sys.getsizeof(table.records) + sys.getsizeof(table.offsets)
+            for record in table.records:
+                size += sys.getsizeof(record)
+                size += sum(sys.getsizeof(getattr(record, field)) for field in CatalogRecord.__slots__)
+        return size
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "rows": {entity_type: len(table.records) for entity_type, table in self.tables.items()},
+            "bytes": self.size_bytes()
+        }
+
+
+def catalog_version(session):
+    return session.execute(select(func.max(Change.id))).scalar() or 0
+
+
+def load(session):
+    # the version is read first, a change that lands while the tables are
+    # read only makes the next check load again
+    version = catalog_version(session)
+    tables = {}
+    for entity_type, model in CATALOG_MODELS.items():
+        rows = session.execute(
+            select(model.id, model.name, model.description, model.imageLink).order_by(model.id)
+        ).all()
+        tables[entity_type] = CatalogTable(CatalogRecord(*row) for row in rows)
+    return CatalogSnapshot(version, tables)
+
+
+class SnapshotHolder:
+    def __init__(self):
+        self.snapshot = None
+        # newest catalog version this worker has heard of
+        self.latest = 0
+        self.checked_at = 0
+        self.lock = threading.Lock()
+        self.listening = False
+
+    def on_change(self, change):
+        if change["entity_type"] in CATALOG_MODELS:
+            self.latest = max(self.latest, change["version"])
+
+    def current(self):
+        if not self.listening:
+            with self.lock:
+                # two threads can get here at once, only one registers
+                if not self.listening:
+                    bus.add_listener(self.on_change)
+                    self.listening = True
+        bus.start()
+
+        snapshot = self.snapshot
+        if time.time() - self.checked_at > SNAPSHOT_DB_CHECK_SECONDS:
+            self.checked_at = time.time()
+            self.latest = max(self.latest, catalog_version(db.session))
+
+        if snapshot is None or snapshot.version < self.latest:
+            with self.lock:
+                snapshot = self.snapshot
+                if snapshot is None or snapshot.version < self.latest:
+                    snapshot = load(db.session)
+                    self.snapshot = snapshot
+                    self.latest = max(self.latest, snapshot.version)
+                    stats = snapshot.stats()
+                    current_app.logger.info(
+                        "Catalog snapshot v%s loaded in worker %s: %s rows, %s bytes",
+                        stats["version"], stats["pid"], sum(stats["rows"].values()), stats["bytes"]
+                    )
+        return snapshot
+
+
+holder = SnapshotHolder()
+
+
+def catalog_table(entity_type):
+    """The snapshot table for an entity type, or None when snapshots are off."""
+    if not SNAPSHOT_ENABLED:
+        return None
+    return holder.current().tables[entity_type]
+
+
+def snapshot_stats():
+    if not SNAPSHOT_ENABLED:
+        return None
+    return holder.current().stats()
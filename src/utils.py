@@ -15,13 +15,40 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def parse_ids(value, limit=100):
+    # "1,2,3" -> [1, 2, 3], duplicates dropped and order kept
+    if value is None:
+        return None
+    ids = []
+    seen = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        # isdigit() alone also takes unicode digits like "²" that int() rejects
+        if not (part.isascii() and part.isdigit()):
+            raise APIException("ids must be a comma separated list of integers")
+        if int(part) not in seen:
+            seen.add(int(part))
+            ids.append(int(part))
+            if len(ids) > limit:
+                raise APIException("at most {} ids per request".format(limit))
+    return ids
+
+def get_by_ids(model, ids):
+    # one IN query, rows come back in the order the ids were asked for
+    if not ids:
+        return []
+    found = {item.id: item for item in model.query.filter(model.id.in_(ids)).all()}
+    return [found[item_id] for item_id in ids if item_id in found]
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = ['/admin/'] if app.config.get('ADMIN_ENABLED') else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -0,0 +1,53 @@
+"""
+Warms a worker up before it takes traffic: opens the pool connections and
+runs the hot read endpoints once, so query compilation, routing and the
+in-process caches are paid for here and not by the first real requests.
+"""
+import os
+import time
+from sqlalchemy import text
+from models import db
+
+# single rows and ?ids= lookups, they go through the same code as the lists
+# (and the snapshot when it's on) without reading whole tables on every boot
+WARMUP_PATHS = os.getenv(
+    "WARMUP_PATHS",
+    "/character/1,/character?ids=1,/planet?ids=1,/user/1,/user/1/favorites,/changes?limit=1"
+).split(",")
+
+
+def open_pool(engine, limit):
+    pool = engine.pool
+    size = min(pool.size(), limit) if hasattr(pool, "size") else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connection.execute(text("SELECT 1"))
+            connections.append(connection)
+    finally:
+        # closing hands them back to the pool, they stay open
+        for connection in connections:
+            connection.close()
+
+
+def warm_up(app, connections=1):
+    start = time.perf_counter()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            open_pool(engine, connections)
+
+    client = app.test_client()
+    for path in WARMUP_PATHS:
+        try:
+            response = client.get(path.strip())
+            # a 404 on an empty database still warms the route up, a 405 or
+            # a 5xx means the path is wrong or broken
+            if response.status_code == 405 or response.status_code >= 500:
+                app.logger.warning("Warmup request to %s returned %s", path, response.status_code)
+        except Exception:
+            # warming up must never keep a worker from starting
+            app.logger.exception("Warmup request to %s failed", path)
+
+    return time.perf_counter() - start
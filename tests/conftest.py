@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+
+# the app reads its configuration at import time, point it at a throwaway
+# database unless TEST_DATABASE_URL (e.g. a local Postgres) is given
+_db_file = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", "sqlite:///" + _db_file)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+from sqlalchemy import event
+
+from app import app as flask_app
+from models import db, User, CATALOG_MODELS, FAVORITE_MODELS
+
+USERS = 300
+ENTITIES = 300
+FAVORITES_PER_USER = 10
+
+
+def seed():
+    db.session.add_all(
+        User(email="user{}@example.com".format(n), password="secret", user_name="user{}".format(n))
+        for n in range(USERS)
+    )
+    for entity_type, model in CATALOG_MODELS.items():
+        db.session.add_all(
+            model(name="{} {}".format(entity_type, n), description="description", imageLink="https://example.com/{}.png".format(n))
+            for n in range(ENTITIES)
+        )
+    db.session.flush()
+
+    for entity_type, favorite in FAVORITE_MODELS.items():
+        db.session.add_all(
+            favorite(**{"user_id": user_id, entity_type + "_id": (user_id * 7 + n) % ENTITIES + 1})
+            for user_id in range(1, USERS + 1)
+            for n in range(FAVORITES_PER_USER)
+        )
+    db.session.commit()
+
+
+@pytest.fixture(scope="session")
+def app():
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class Capture:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters[0] if executemany else parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+@pytest.fixture
+def capture_sql(app):
+    """Records every statement sent to the database inside the with block."""
+    def capture():
+        with app.app_context():
+            engine = db.engine
+        return Capture(engine)
+    return capture
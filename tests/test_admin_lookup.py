@@ -0,0 +1,56 @@
+"""
+Prefix search of the admin AJAX lookups, it has to find what the stock
+'%term%' loader would find at the start of the column, on sqlite too.
+"""
+import pytest
+
+pytest.importorskip("flask_admin")
+
+from admin_views import PrefixAjaxModelLoader, prefix_upper_bound
+from models import db, Vehicle
+
+
+@pytest.fixture
+def vehicles(app):
+    with app.app_context():
+        names = ["Ñandu Walker", "ñandu walker", "Snow Speeder", "\U0010ffff\U0010ffff bike"]
+        items = [Vehicle(name=name, description="d", imageLink="i") for name in names]
+        db.session.add_all(items)
+        db.session.commit()
+        ids = dict(zip(names, (item.id for item in items)))
+    yield ids
+    with app.app_context():
+        db.session.query(Vehicle).filter(Vehicle.id.in_(ids.values())).delete()
+        db.session.commit()
+
+
+def lookup(term):
+    loader = PrefixAjaxModelLoader("vehicle", db.session, Vehicle, fields=["name"])
+    return {vehicle.name for vehicle in loader.get_list(term)}
+
+
+def test_upper_bound():
+    assert prefix_upper_bound("ab") == "ac"
+    assert prefix_upper_bound("a\U0010ffff") == "b"
+    assert prefix_upper_bound("\U0010ffff") is None
+    assert prefix_upper_bound("\ud7ff") == "\ue000"
+
+
+def test_ascii_letters_ignore_case(app, vehicles):
+    with app.app_context():
+        assert lookup("SNOW sp") == {"Snow Speeder"}
+
+
+def test_non_ascii_letters_match_as_stored(app, vehicles):
+    with app.app_context():
+        if db.engine.dialect.name == "postgresql":
+            assert lookup("Ñandu") == {"Ñandu Walker", "ñandu walker"}
+        else:
+            # sqlite's lower() doesn't fold Ñ, neither does the term
+            assert lookup("Ñandu") == {"Ñandu Walker"}
+            assert lookup("ñandu") == {"ñandu walker"}
+
+
+def test_last_code_point(app, vehicles):
+    with app.app_context():
+        assert lookup("\U0010ffff") == {"\U0010ffff\U0010ffff bike"}
@@ -0,0 +1,33 @@
+"""
+Input checks of the ?ids= lookups and /batch, bad input is a 400 and never a 500.
+"""
+import pytest
+
+from utils import APIException, parse_ids
+
+
+def test_parse_ids_keeps_order_and_drops_duplicates():
+    assert parse_ids("3, 1,3,,2") == [3, 1, 2]
+
+
+@pytest.mark.parametrize("value", ["1,a", "²", "1,٣", "-1", "1.5"])
+def test_parse_ids_rejects_non_integers(value):
+    with pytest.raises(APIException):
+        parse_ids(value)
+
+
+def test_parse_ids_limit_counts_distinct_ids():
+    assert len(parse_ids(",".join(["7"] * 500))) == 1
+    with pytest.raises(APIException):
+        parse_ids(",".join(str(n) for n in range(101)))
+
+
+def test_unicode_digits_are_a_bad_request(client):
+    response = client.get("/character?ids=²")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("body", [["/character/1"], "/character/1", 7])
+def test_batch_body_must_be_an_object(client, body):
+    response = client.post("/batch", json=body)
+    assert response.status_code == 400
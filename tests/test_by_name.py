@@ -0,0 +1,32 @@
+"""
+Case insensitive lookups by name when names only differ in case, the unique
+constraint on name doesn't stop "Luke" and "LUKE" from both existing.
+"""
+import pytest
+
+from models import db, Vehicle
+
+
+@pytest.fixture
+def case_duplicates(app):
+    with app.app_context():
+        names = ["Speeder Bike", "SPEEDER BIKE", "speeder bike"]
+        vehicles = [Vehicle(name=name, description="d", imageLink="i") for name in names]
+        db.session.add_all(vehicles)
+        db.session.commit()
+        ids = [vehicle.id for vehicle in vehicles]
+    yield ids
+    with app.app_context():
+        db.session.query(Vehicle).filter(Vehicle.id.in_(ids)).delete()
+        db.session.commit()
+
+
+def test_oldest_wins(client, case_duplicates):
+    response = client.get("/vehicle/by-name/sPeEdEr bike")
+    assert response.status_code == 200
+    assert response.get_json()["vehicle"]["id"] == case_duplicates[0]
+
+
+def test_bulk_form_picks_the_same_row(client, case_duplicates):
+    response = client.get("/vehicle/by-name?name=SPEEDER BIKE&name=speeder bike")
+    assert [vehicle["id"] for vehicle in response.get_json()["vehicles"]] == [case_duplicates[0]] * 2
@@ -0,0 +1,130 @@
+"""
+Last-Event-ID resume on /stream. A reconnect can land on any worker, so
+the replay has to come from the change logs and not from what this worker's
+bus happened to see.
+"""
+from events import EventBus, change_log, log_heads, load_changes, format_event_id
+from models import db, Change, User, Planet
+
+
+def new_bus(tmp_path, queue_size=100):
+    # a worker that just started, it hasn't delivered a single event
+    return EventBus(directory=str(tmp_path), queue_size=queue_size)
+
+
+def drain(subscriber):
+    changes = []
+    while True:
+        change = subscriber.get(timeout=0)
+        if change is None:
+            return changes
+        changes.append(change)
+
+
+def test_resume_replays_from_the_change_logs(app, tmp_path):
+    with app.app_context():
+        heads = log_heads(db.session)
+        cursor = {"catalog": heads["catalog"] - 3, "favorite": heads["favorite"] - 2}
+        subscriber = new_bus(tmp_path).subscribe(format_event_id(cursor))
+
+    assert not subscriber.reset
+    changes = drain(subscriber)
+    assert [change["version"] for change in changes if change_log(change) == "catalog"] == \
+        [heads["catalog"] - 2, heads["catalog"] - 1, heads["catalog"]]
+    assert [change["version"] for change in changes if change_log(change) == "favorite"] == \
+        [heads["favorite"] - 1, heads["favorite"]]
+    assert all("user_id" in change for change in changes if change_log(change) == "favorite")
+    assert subscriber.event_id() == format_event_id(heads)
+
+
+def test_gap_longer_than_the_queue_resets(app, tmp_path):
+    with app.app_context():
+        heads = log_heads(db.session)
+        subscriber = new_bus(tmp_path, queue_size=5).subscribe("0:0")
+
+    assert subscriber.reset
+    assert drain(subscriber) == []
+    assert subscriber.event_id() == format_event_id(heads)
+
+
+def test_unknown_event_id_resets(app, tmp_path):
+    with app.app_context():
+        subscriber = new_bus(tmp_path).subscribe("17")
+
+    assert subscriber.reset
+    assert drain(subscriber) == []
+
+
+def test_cascaded_favorite_deletes_are_one_event(app, client, tmp_path):
+    with app.app_context():
+        user = User(email="cascade@events.test", password="secret", user_name="cascade")
+        planet = Planet(name="cascade planet", description="d", imageLink="i")
+        db.session.add_all([user, planet])
+        db.session.commit()
+        user_id, planet_id = user.id, planet.id
+    for path in ["/user/{}/favorite/planet/{}".format(user_id, planet_id), "/user/{}/favorite/character/1".format(user_id)]:
+        assert client.post(path).status_code == 201
+
+    with app.app_context():
+        heads = log_heads(db.session)
+
+    # the favorites go through ON DELETE CASCADE, the deletes they follow
+    # stand for all of them
+    assert client.delete("/planet/{}".format(planet_id)).status_code == 200
+    assert client.delete("/user/{}".format(user_id)).status_code == 200
+
+    with app.app_context():
+        subscriber = new_bus(tmp_path).subscribe(format_event_id(heads))
+    changes = drain(subscriber)
+    assert [(change["entity_type"], change["id"], change["operation"]) for change in changes] == [
+        ("planet", planet_id, "delete"),
+        ("user", user_id, "delete")
+    ]
+    assert changes[1]["user_id"] == user_id
+
+
+def new_catalog_changes(app, client, count):
+    with app.app_context():
+        heads = log_heads(db.session)
+    for n in range(count):
+        assert client.post("/planet", json={"name": "gap planet {} {}".format(heads["catalog"], n), "description": "d", "imageLink": "i"}).status_code == 201
+    with app.app_context():
+        return heads, load_changes(db.session, "catalog", Change.id > heads["catalog"])
+
+
+def test_lost_catalog_datagram_is_read_from_the_log(app, client, tmp_path):
+    with app.app_context():
+        subscriber = new_bus(tmp_path).subscribe()
+    heads, changes = new_catalog_changes(app, client, 3)
+
+    # the first two datagrams never arrived
+    subscriber.offer(changes[2])
+    assert [change["version"] for change in drain(subscriber)] == [change["version"] for change in changes]
+    assert subscriber.event_id() == format_event_id({"catalog": changes[2]["version"], "favorite": heads["favorite"]})
+
+
+def test_out_of_order_datagrams_are_sent_once_and_in_order(app, client, tmp_path):
+    with app.app_context():
+        subscriber = new_bus(tmp_path).subscribe()
+    heads, changes = new_catalog_changes(app, client, 2)
+
+    subscriber.offer(changes[1])
+    subscriber.offer(changes[0])
+    assert [change["version"] for change in drain(subscriber)] == [change["version"] for change in changes]
+
+
+def test_favorite_gap_holds_the_event_id_until_given_up(app, tmp_path):
+    with app.app_context():
+        subscriber = new_bus(tmp_path).subscribe()
+        heads = log_heads(db.session)
+
+    # versions head + 1 and head + 2 are still being committed somewhere
+    later = {"entity_type": "favorite_planet", "id": 1, "user_id": 1, "operation": "insert", "version": heads["favorite"] + 3}
+    subscriber.offer(later)
+    assert drain(subscriber) == [later]
+    assert subscriber.event_id() == format_event_id(heads)
+
+    # EVENTS_GAP_SECONDS later nothing showed up in the log, rolled back
+    subscriber.holes = dict.fromkeys(subscriber.holes, 0)
+    assert drain(subscriber) == []
+    assert subscriber.event_id() == format_event_id({"catalog": heads["catalog"], "favorite": heads["favorite"] + 3})
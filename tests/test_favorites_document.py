@@ -0,0 +1,128 @@
+"""
+The stored favorites documents have to stay equal to what build_document
+returns from the favorite tables, which is what `flask favorites check`
+verifies, through every write path the flush hook patches.
+"""
+import json
+
+import pytest
+
+from favorites_document import build_document
+from models import db, User, Character, Planet, Film, Favorite_film, Favorite_planet, Favorites_document
+
+
+@pytest.fixture
+def documents_enabled(app, monkeypatch):
+    monkeypatch.setattr("favorites_document.FAVORITES_DOCUMENT_ENABLED", True)
+    monkeypatch.setattr("app.FAVORITES_DOCUMENT_ENABLED", True)
+    yield
+    with app.app_context():
+        db.session.query(Favorites_document).delete()
+        db.session.commit()
+
+
+def assert_documents_match(app, client, user_ids):
+    for user_id in user_ids:
+        served = client.get("/user/{}/favorites".format(user_id)).get_json()
+        with app.app_context():
+            stored = db.session.get(Favorites_document, user_id)
+            expected = build_document(db.session, user_id)
+        assert stored is not None
+        assert json.loads(stored.body) == expected
+        assert served == expected
+
+
+def create(model, **values):
+    item = model(**values)
+    db.session.add(item)
+    db.session.commit()
+    return item.id
+
+
+def test_documents_follow_every_write(app, client, documents_enabled):
+    with app.app_context():
+        first = create(User, email="first@docs.test", password="secret", user_name="first")
+        second = create(User, email="second@docs.test", password="secret", user_name="second")
+        luke = create(Character, name="docs luke", description="d", imageLink="i")
+        leia = create(Character, name="docs leia", description="d", imageLink="i")
+        tatooine = create(Planet, name="docs tatooine", description="d", imageLink="i")
+        hoth = create(Planet, name="docs hoth", description="d", imageLink="i")
+        film = create(Film, name="docs film", description="d", imageLink="i")
+
+    # built and stored on first read, patched from here on
+    assert_documents_match(app, client, [first, second])
+
+    # favorite added
+    for path in [
+        "/user/{}/favorite/character/{}".format(first, luke),
+        "/user/{}/favorite/character/{}".format(first, leia),
+        "/user/{}/favorite/planet/{}".format(first, tatooine),
+        "/user/{}/favorite/character/{}".format(second, luke),
+        "/user/{}/favorite/planet/{}".format(second, hoth),
+    ]:
+        assert client.post(path).status_code == 201
+    with app.app_context():
+        create(Favorite_film, user_id=second, film_id=film)
+    assert_documents_match(app, client, [first, second])
+
+    # favorited entity updated
+    assert client.put("/character/{}".format(luke), json={"description": "updated"}).status_code == 200
+    assert_documents_match(app, client, [first, second])
+
+    # favorite removed
+    assert client.delete("/user/{}/favorite/character/{}".format(first, leia)).status_code == 200
+    assert_documents_match(app, client, [first, second])
+
+    # favorite moved to another user
+    with app.app_context():
+        favorite = db.session.execute(
+            db.select(Favorite_planet).filter_by(user_id=second, planet_id=hoth)
+        ).scalar_one()
+        favorite.user_id = first
+        db.session.commit()
+    assert_documents_match(app, client, [first, second])
+
+    # favorited entity deleted, its favorites go through ON DELETE CASCADE
+    assert client.delete("/character/{}".format(luke)).status_code == 200
+    assert_documents_match(app, client, [first, second])
+
+    # a user deleted takes its own document along
+    assert client.delete("/user/{}".format(second)).status_code == 200
+    with app.app_context():
+        assert db.session.get(Favorites_document, second) is None
+    assert_documents_match(app, client, [first])
+
+
+def stored_body(app, user_id):
+    with app.app_context():
+        return db.session.get(Favorites_document, user_id).body
+
+
+def test_entity_update_empties_documents(app, client, documents_enabled, capture_sql):
+    with app.app_context():
+        users = [create(User, email="fan{}@docs.test".format(n), password="secret", user_name="fan{}".format(n)) for n in range(3)]
+        planet = create(Planet, name="docs bespin", description="d", imageLink="i")
+    for user_id in users:
+        assert client.post("/user/{}/favorite/planet/{}".format(user_id, planet)).status_code == 201
+    assert_documents_match(app, client, users)
+
+    with capture_sql() as captured:
+        assert client.put("/planet/{}".format(planet), json={"description": "cloud city"}).status_code == 200
+    # one UPDATE for every fan, not one per document
+    updates = [statement for statement, _ in captured.statements if statement.upper().startswith("UPDATE FAVORITES_DOCUMENT")]
+    assert len(updates) == 1
+    assert all(stored_body(app, user_id) is None for user_id in users)
+    assert_documents_match(app, client, users)
+
+
+def test_write_during_a_build_is_not_lost(app, client, documents_enabled):
+    with app.app_context():
+        user_id = create(User, email="claimed@docs.test", password="secret", user_name="claimed")
+        planet = create(Planet, name="docs endor", description="d", imageLink="i")
+        # a read claimed the row and is still building it
+        db.session.add(Favorites_document(user_id=user_id))
+        db.session.commit()
+
+    assert client.post("/user/{}/favorite/planet/{}".format(user_id, planet)).status_code == 201
+    assert stored_body(app, user_id) is None
+    assert_documents_match(app, client, [user_id])
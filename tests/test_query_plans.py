@@ -0,0 +1,108 @@
+"""
+Query plan regression tests.
+
+Every case sends one request through the Flask test client, captures the SQL
+it issues and asks the database for the plan of each SELECT, UPDATE and
+DELETE. A case fails when a statement scans a whole table that the endpoint
+is not expected to scan, or when the request goes over its statement budget.
+
+On SQLite the plans come from EXPLAIN QUERY PLAN. Run the suite against a
+local Postgres with TEST_DATABASE_URL=postgresql://... to check EXPLAIN
+there too; sequential scans are disabled for the EXPLAIN so a Seq Scan only
+shows up when no index can serve the query.
+"""
+import json
+import re
+
+import pytest
+
+from models import db
+
+# (method, path, json body, statement budget, tables it may scan whole)
+CASES = [
+    ("GET", "/", None, 0, ()),
+    ("GET", "/user", None, 1, ("user",)),
+    ("GET", "/character", None, 1, ("character",)),
+    ("GET", "/planet", None, 1, ("planet",)),
+    ("GET", "/character?ids=5,3,9", None, 1, ()),
+    ("GET", "/planet?ids=5,3,9", None, 1, ()),
+    ("GET", "/user/1", None, 1, ()),
+    ("GET", "/character/1", None, 1, ()),
+    ("GET", "/user/2/favorites", None, 6, ()),
+    ("GET", "/changes?since=1000&limit=50", None, 6, ()),
+    ("GET", "/character/by-name/CHARACTER 10", None, 1, ()),
+    ("GET", "/film/by-name/film 10", None, 1, ()),
+    ("GET", "/specie/by-name?name=Specie 1&name=specie 2&name=nope", None, 1, ()),
+    ("GET", "/character/1/favorited-by?limit=5", None, 2, ()),
+    ("GET", "/planet/1/favorited-by?after=100&limit=5", None, 2, ()),
+    ("GET", "/film/1/favorited-by?count_only=true", None, 2, ()),
+    ("POST", "/user", {"email": "new@example.com", "password": "secret", "user_name": "new"}, 2, ()),
+    ("POST", "/character", {"name": "new character", "description": "d", "imageLink": "i"}, 3, ()),
+    ("POST", "/planet", {"name": "new planet", "description": "d", "imageLink": "i"}, 3, ()),
+    ("PUT", "/character/3", {"description": "updated"}, 4, ()),
+    ("PUT", "/planet/3", {"description": "updated"}, 4, ()),
+    ("POST", "/user/5/favorite/character/200", None, 6, ()),
+    ("DELETE", "/user/5/favorite/character/200", None, 3, ()),
+    ("POST", "/user/5/favorite/planet/200", None, 6, ()),
+    ("DELETE", "/user/5/favorite/planet/200", None, 3, ()),
+    ("POST", "/batch", {"requests": ["/character/1", "/planet/2", "/user/3"]}, 3, ()),
+    ("DELETE", "/character/250", None, 3, ()),
+    ("DELETE", "/user/300", None, 4, ()),
+]
+
+
+def sqlite_scans(connection, statement, parameters):
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    scans = set()
+    for row in rows:
+        match = re.match(r"SCAN (\w+)", row[-1])
+        if match:
+            scans.add(match.group(1))
+    return scans
+
+
+def postgres_scans(connection, statement, parameters):
+    # LOCAL ends with the transaction, the pooled connection goes back to
+    # the other tests with sequential scans on
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    scans = set()
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get("Plans", []))
+        full_index_scan = node["Node Type"] in ("Index Scan", "Index Only Scan") and "Index Cond" not in node
+        if node["Node Type"] == "Seq Scan" or full_index_scan:
+            scans.add(node["Relation Name"])
+    return scans
+
+
+def scanned_tables(connection, statement, parameters):
+    if connection.dialect.name == "postgresql":
+        return postgres_scans(connection, statement, parameters)
+    return sqlite_scans(connection, statement, parameters)
+
+
+@pytest.mark.parametrize("method, path, body, budget, allowed_scans", CASES)
+def test_query_plan(app, client, capture_sql, method, path, body, budget, allowed_scans):
+    with capture_sql() as captured:
+        response = client.open(path, method=method, json=body)
+    assert response.status_code < 400, response.get_data(as_text=True)
+    statements = captured.statements
+
+    assert len(statements) <= budget, "{} statements, budget is {}:\n\n{}".format(
+        len(statements), budget, "\n\n".join(statement for statement, _ in statements))
+
+    problems = []
+    with app.app_context():
+        with db.engine.connect() as connection:
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                unexpected = scanned_tables(connection, statement, parameters) - set(allowed_scans)
+                if unexpected:
+                    problems.append("{}\n  scans {}".format(statement, ", ".join(sorted(unexpected))))
+    assert not problems, "\n\n".join(problems)